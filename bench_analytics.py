@@ -0,0 +1,201 @@
+"""Benchmark the visit analytics reports over a year of synthetic vms rows.
+
+Usage: python bench_analytics.py [visits_per_day] [--mysql]
+
+By default the column query is answered by SyntheticCursor, which applies the query's
+COALESCE/CASE mapping to in-memory visits but does not parse SQL. With --mysql the synthetic
+visits are loaded into a TEMPORARY vms table (it shadows the real table for that session only)
+and the real queries run against it; it refuses to run unless DB_HOST is set explicitly.
+"""
+import bisect
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import main
+
+HOSTS = [f"EMP{i:03d}" for i in range(200)]
+CATEGORIES = ['Vendor', 'Contractor', 'Interview', 'Guest', 'Delivery']
+STATUS_CODES = {'A': main.VISIT_APPROVED, 'R': main.VISIT_REJECTED}
+
+
+class SyntheticCursor:
+    """Answers the analytics column query from in-memory visits sorted by entry."""
+
+    def __init__(self, visits):
+        self.visits = visits
+        self.entries = [visit[0] for visit in visits]
+        self.versions = self.day_versions(visits)  # MySQL computes these server-side
+        self.result = []
+
+    def execute(self, query, params):
+        assert "FROM vms WHERE" in query and query.count("entry_date >= %s") * 2 == len(params)
+        self.result = []
+        for first, after in zip(params[::2], params[1::2]):
+            lo = bisect.bisect_left(self.entries, main.day_seconds(first))
+            hi = bisect.bisect_left(self.entries, main.day_seconds(after))
+            if "GROUP BY DATE(entry_date)" in query:
+                self.result.extend((day, *version) for day, version in self.versions.items() if first <= day < after)
+            else:
+                self.result.extend(
+                    (entry, -1 if approve_dt is None else approve_dt, -1 if out is None else out,
+                     STATUS_CODES.get(approve, main.VISIT_PENDING), host, category)
+                    for entry, approve_dt, out, approve, host, category in self.visits[lo:hi]
+                )
+
+    @staticmethod
+    def day_versions(visits):
+        versions = {}
+        for entry, approve_dt, out, approve, _, _ in visits:
+            day = main.EPOCH_DAY + timedelta(days=entry // 86400)
+            count, decided, checked_out, changed = versions.get(day, (0, 0, 0, 0))
+            versions[day] = (count + 1, decided + (approve != 'P'), checked_out + (out is not None),
+                             max(changed, entry, approve_dt or 0, out or 0))
+        return versions
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+def synthetic_visits(start_day, days, per_day, today):
+    """(entry, approve_dt, out_time, approve, emp_id, category) with times in epoch seconds."""
+    rng = random.Random(26)
+    visits = []
+    for d in range(days):
+        day = start_day + timedelta(days=d)
+        base = main.day_seconds(day)
+        recent = (today - day).days < 2
+        for _ in range(per_day):
+            entry = base + int(rng.gauss(11, 2.5) % 24 * 3600)
+            if rng.random() < (0.05 if recent else 0.0005):
+                visits.append((entry, None, None, 'P', rng.choice(HOSTS), rng.choice(CATEGORIES)))
+                continue
+            approve_dt = entry + int(rng.expovariate(1 / 600))
+            approve = 'R' if rng.random() < 0.05 else 'A'
+            out = None
+            if approve == 'A' and not (recent and rng.random() < 0.3):
+                out = approve_dt + int(rng.expovariate(1 / 5400))
+            visits.append((entry, approve_dt, out, approve, rng.choice(HOSTS), rng.choice(CATEGORIES)))
+    visits.sort(key=lambda visit: visit[0])
+    return visits
+
+
+def mysql_cursor(visits):
+    if "DB_HOST" not in os.environ:
+        sys.exit("--mysql loads the synthetic visits into a database; set DB_HOST (and DB_USER, DB_PASSWORD, "
+                 "DB_NAME, DB_PORT) to a scratch server explicitly")
+    conn = main.VMSDatabase().get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TEMPORARY TABLE vms (
+            entry_date DATETIME, approve_dt DATETIME, out_time DATETIME, approve CHAR(1),
+            emp_id VARCHAR(20), visitor_category VARCHAR(50), created_date DATETIME, modify_date DATETIME,
+            INDEX (entry_date)
+        )
+    """)
+    as_datetime = lambda seconds: None if seconds is None else datetime(1970, 1, 1) + timedelta(seconds=seconds)
+    cursor.executemany(
+        "INSERT INTO vms VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        [(as_datetime(e), as_datetime(a), as_datetime(o), s, h, c, as_datetime(e), as_datetime(o or a))
+         for e, a, o, s, h, c in visits],
+    )
+    return conn, cursor
+
+
+def percentile(ordered, p):
+    position = (len(ordered) - 1) * p / 100.0
+    below = int(position)
+    above = min(below + 1, len(ordered) - 1)
+    return ordered[below] + (ordered[above] - ordered[below]) * (position - below)
+
+
+def python_duration_stats(rows, end_index, group_index, approved_only=False):
+    # Row-by-row reference computing the same statistics as main.duration_stats
+    groups = {}
+    for row in rows:
+        entry, end = row[0], row[end_index]
+        if end < 0 or end < entry or (approved_only and row[3] != main.VISIT_APPROVED):
+            continue
+        groups.setdefault(row[group_index], []).append((end - entry) / 60.0)
+
+    stats = {}
+    for label, values in groups.items():
+        values.sort()
+        stats[label] = {
+            "count": len(values),
+            "mean_minutes": round(sum(values) / len(values), 2),
+            **{f"p{p}_minutes": round(percentile(values, p), 2) for p in main.ANALYTICS_PERCENTILES},
+            "max_minutes": round(values[-1], 2),
+        }
+    return stats
+
+
+def check_same(numpy_result, python_result, group_by):
+    groups = {group.pop(group_by): group for group in numpy_result["groups"]}
+    assert groups.keys() == python_result.keys()
+    for label, expected in python_result.items():
+        for key, value in expected.items():
+            assert abs(groups[label][key] - value) <= 0.011, (label, key, groups[label][key], value)
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f"{label:<42} {(time.perf_counter() - started) * 1000:9.1f} ms")
+    return result
+
+
+def run(per_day, use_mysql):
+    end_day = datetime.now().date()
+    start_day = end_day - timedelta(days=364)
+    visits = timed("generate synthetic visits", lambda: synthetic_visits(start_day, 365, per_day, end_day))
+    print(f"{len(visits)} visits, {start_day} .. {end_day}")
+    conn, cursor = timed("load into temporary table", lambda: mysql_cursor(visits)) if use_mysql \
+        else (None, SyntheticCursor(visits))
+
+    try:
+        main.analytics_day_cache.clear()
+        columns = timed("load columns (cold cache)", lambda: main.load_visit_columns(cursor, start_day, end_day))
+        print(f"{len(main.analytics_day_cache)} days cached")
+        cached = dict(main.analytics_day_cache)
+        timed("load columns (warm cache)", lambda: main.load_visit_columns(cursor, start_day, end_day))
+        refetched = sum(main.analytics_day_cache[day] is not cached[day] for day in cached)
+        print(f"{refetched} days refetched on the warm run")
+    finally:
+        cursor.close()
+        if conn:
+            conn.close()
+
+    # Row tuples exactly as the column query returns them, for the row-by-row reference
+    rows = [
+        (int(e), int(a), int(o), int(s), h, c)
+        for e, a, o, s, h, c in zip(columns['entry'], columns['approve'], columns['out'], columns['status'],
+                                    np.array(columns['host_labels'], dtype=object)[columns['host']],
+                                    np.array(columns['category_labels'], dtype=object)[columns['category']])
+    ]
+
+    timed("heatmap", lambda: main.arrival_heatmap(columns))
+    timed("dwell overall", lambda: main.duration_stats(columns, 'out'))
+    dwell = timed("dwell by host (NumPy)", lambda: main.duration_stats(columns, 'out', 'host'))
+    python_dwell = timed("dwell by host (row-by-row Python)", lambda: python_duration_stats(rows, 2, 4))
+    approved = columns['status'] == main.VISIT_APPROVED
+    turnaround = timed("turnaround by category (NumPy)",
+                       lambda: main.duration_stats(columns, 'approve', 'category', approved))
+    python_turnaround = timed("turnaround by category (row-by-row Python)",
+                              lambda: python_duration_stats(rows, 1, 5, approved_only=True))
+
+    check_same(dwell, python_dwell, 'host')
+    check_same(turnaround, python_turnaround, 'category')
+    print("NumPy and row-by-row results match")
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--mysql"]
+    run(int(args[0]) if args else 300, "--mysql" in sys.argv)
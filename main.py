@@ -2,13 +2,14 @@ from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import mysql.connector
 from datetime import datetime, timedelta
 import hashlib
 import json
 import jwt
 import os
+import numpy as np
 
 # FastAPI app initialization
 app = FastAPI(title="Visitor Management System API", version="1.0.0")
@@ -57,6 +58,23 @@ PERMISSIONS = {
     ]
 }
 
+# Analytics Configuration
+ANALYTICS_REPORTS = ['heatmap', 'dwell', 'turnaround']
+ANALYTICS_GROUPS = ['host', 'category']
+ANALYTICS_PERCENTILES = [50, 90, 95]
+ANALYTICS_DEFAULT_RANGE_DAYS = 30
+ANALYTICS_MAX_RANGE_DAYS = 731
+ANALYTICS_CACHE_MAX_DAYS = int(os.getenv("ANALYTICS_CACHE_MAX_DAYS", "800"))
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+EPOCH_DAY = datetime(1970, 1, 1).date()
+VISIT_PENDING, VISIT_APPROVED, VISIT_REJECTED = 0, 1, 2
+
+# Columnar vms slices keyed by day, each stored with the day's version from fetch_day_versions.
+# Every request re-reads the versions, so a cached day is reused only while the database still
+# agrees with it; this covers late approvals/checkouts, new arrivals today and clock skew alike.
+analytics_day_cache: Dict[Any, Tuple[tuple, Dict[str, Any]]] = {}
+EMPTY_DAY_VERSION = (0, 0, 0, None)
+
 # Pydantic Models
 class UserLogin(BaseModel):
     empid: str
@@ -168,6 +186,230 @@ def require_permission(permission: str):
         return current_user
     return permission_checker
 
+# Analytics Functions
+def parse_report_range(start_date: Optional[str], end_date: Optional[str]):
+    try:
+        end_day = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else datetime.now().date()
+        start_day = (datetime.strptime(start_date, '%Y-%m-%d').date() if start_date
+                     else end_day - timedelta(days=ANALYTICS_DEFAULT_RANGE_DAYS - 1))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+    if start_day > end_day:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    if (end_day - start_day).days + 1 > ANALYTICS_MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range exceeds {ANALYTICS_MAX_RANGE_DAYS} days")
+    return start_day, end_day
+
+def day_seconds(day) -> int:
+    # Seconds since 1970-01-01 00:00 in naive server time, same scale as the SQL below
+    return (day - EPOCH_DAY).days * 86400
+
+def day_runs(days: list) -> List[list]:
+    """Group sorted days into [first, last] runs of consecutive days."""
+    runs = []
+    for day in days:
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+def encode_labels(labels: list):
+    # Codes are local to one slice; merge_visit_columns maps them onto a per-request vocabulary
+    codes = {}
+    encoded = np.fromiter((codes.setdefault(label, len(codes)) for label in labels),
+                          dtype=np.int32, count=len(labels))
+    return encoded, list(codes)
+
+def split_visit_columns(rows: list, days: list) -> Dict[Any, Dict[str, Any]]:
+    """Turn (entry, approve_dt, out, status, host, category) rows sorted by entry into per-day column arrays."""
+    n = len(rows)
+    numbers = np.fromiter((value for row in rows for value in row[:4]), dtype=np.int64, count=4 * n).reshape(n, 4)
+    starts = np.array([day_seconds(day) for day in days], dtype=np.int64)
+    lows = np.searchsorted(numbers[:, 0], starts)
+    highs = np.searchsorted(numbers[:, 0], starts + 86400)
+
+    slices = {}
+    for day, lo, hi in zip(days, lows, highs):
+        hosts, host_labels = encode_labels([row[4] for row in rows[lo:hi]])
+        categories, category_labels = encode_labels([row[5] for row in rows[lo:hi]])
+        slices[day] = {
+            'entry': numbers[lo:hi, 0].copy(),
+            'approve': numbers[lo:hi, 1].copy(),
+            'out': numbers[lo:hi, 2].copy(),
+            'status': numbers[lo:hi, 3].astype(np.int8),
+            'host': hosts,
+            'host_labels': host_labels,
+            'category': categories,
+            'category_labels': category_labels,
+        }
+    return slices
+
+def fetch_visit_columns(cursor, days: list) -> Dict[Any, Dict[str, Any]]:
+    # One round trip for all runs of missing days; NULL approve_dt/out_time come back as -1
+    runs = day_runs(days)
+    ranges = " OR ".join(["(entry_date >= %s AND entry_date < %s)"] * len(runs))
+    params = [bound for first, last in runs for bound in (first, last + timedelta(days=1))]
+    cursor.execute(f"""
+        SELECT TIMESTAMPDIFF(SECOND, '1970-01-01', entry_date),
+               COALESCE(TIMESTAMPDIFF(SECOND, '1970-01-01', approve_dt), -1),
+               COALESCE(TIMESTAMPDIFF(SECOND, '1970-01-01', out_time), -1),
+               CASE approve WHEN 'A' THEN {VISIT_APPROVED} WHEN 'R' THEN {VISIT_REJECTED} ELSE {VISIT_PENDING} END,
+               COALESCE(emp_id, ''), COALESCE(visitor_category, '')
+        FROM vms WHERE {ranges}
+        ORDER BY entry_date
+    """, tuple(params))
+    return split_visit_columns(cursor.fetchall(), days)
+
+def fetch_day_versions(cursor, start_day, end_day) -> Dict[Any, tuple]:
+    """Per-day (rows, decided, checked out, last change) for [start_day, end_day]; days without rows are absent."""
+    # approve P->A/R and checkout only ever move forward, so the two counts catch every update
+    # even when modify_date does not change within the same second
+    cursor.execute("""
+        SELECT DATE(entry_date), COUNT(*), SUM(approve <> 'P'), SUM(out_time IS NOT NULL),
+               MAX(COALESCE(modify_date, created_date))
+        FROM vms WHERE entry_date >= %s AND entry_date < %s
+        GROUP BY DATE(entry_date)
+    """, (start_day, end_day + timedelta(days=1)))
+    return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+def merge_visit_columns(slices: list) -> Dict[str, Any]:
+    merged = {key: np.concatenate([s[key] for s in slices]) for key in ('entry', 'approve', 'out', 'status')}
+    for key in ANALYTICS_GROUPS:
+        codes, parts = {}, []
+        for s in slices:
+            remap = np.array([codes.setdefault(label, len(codes)) for label in s[key + '_labels']], dtype=np.int32)
+            parts.append(remap[s[key]])
+        merged[key] = np.concatenate(parts)
+        merged[key + '_labels'] = list(codes)
+    return merged
+
+def load_visit_columns(cursor, start_day, end_day) -> Dict[str, Any]:
+    """Columnar vms data for [start_day, end_day]; days whose version is unchanged come from analytics_day_cache."""
+    days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    # Read versions before the rows: a write in between only makes the cached version stale, never the data
+    versions = fetch_day_versions(cursor, start_day, end_day)
+    slices = {}
+    for day in days:
+        cached = analytics_day_cache.get(day)
+        if cached and cached[0] == versions.get(day, EMPTY_DAY_VERSION):
+            slices[day] = cached[1]
+    missing = [day for day in days if day not in slices]
+
+    if missing:
+        fetched = fetch_visit_columns(cursor, missing)
+        for day in missing:
+            analytics_day_cache[day] = (versions.get(day, EMPTY_DAY_VERSION), fetched[day])
+        slices.update(fetched)
+
+        # Never evict days this request is using
+        overflow = len(analytics_day_cache) - ANALYTICS_CACHE_MAX_DAYS
+        if overflow > 0:
+            for day in sorted(day for day in analytics_day_cache if day not in slices)[:overflow]:
+                del analytics_day_cache[day]
+
+    return merge_visit_columns([slices[day] for day in days])
+
+def arrival_heatmap(columns: Dict[str, Any]) -> dict:
+    entry = columns['entry']
+    hours = (entry // 3600) % 24
+    weekdays = (entry // 86400 + 3) % 7  # 1970-01-01 was a Thursday
+    grid = np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+    hourly = grid.sum(axis=0)
+    daily = grid.sum(axis=1)
+
+    return {
+        "total": int(entry.size),
+        "weekdays": WEEKDAYS,
+        "heatmap": grid.tolist(),
+        "hourly": hourly.tolist(),
+        "peak_hour": int(hourly.argmax()) if entry.size else None,
+        "peak_weekday": WEEKDAYS[int(daily.argmax())] if entry.size else None,
+    }
+
+def summarize_groups(minutes: np.ndarray, codes: np.ndarray) -> List[dict]:
+    """Count/mean/percentiles/max of minutes for every code present, computed for all groups at once."""
+    order = np.lexsort((minutes, codes))
+    ordered = minutes[order]
+    counts = np.bincount(codes, minlength=1)
+    sums = np.bincount(codes, weights=minutes, minlength=1)
+    present = np.flatnonzero(counts)
+    counts, sums = counts[present], sums[present]
+    starts = np.cumsum(counts) - counts
+    last = starts + counts - 1
+
+    columns = {"count": counts, "mean_minutes": sums / counts}
+    for p in ANALYTICS_PERCENTILES:
+        # Linear interpolation between closest ranks, as np.percentile does
+        position = starts + (counts - 1) * (p / 100.0)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, last)
+        fraction = position - below
+        columns[f"p{p}_minutes"] = ordered[below] * (1 - fraction) + ordered[above] * fraction
+    columns["max_minutes"] = ordered[last]
+
+    rounded = {key: (values.tolist() if key == "count" else np.round(values, 2).tolist())
+               for key, values in columns.items()}
+    return [dict(code=int(code), **{key: rounded[key][i] for key in rounded}) for i, code in enumerate(present)]
+
+def duration_stats(columns: Dict[str, Any], end_key: str, group_by: Optional[str] = None,
+                   rows: Optional[np.ndarray] = None) -> dict:
+    """Statistics of columns[end_key] - entry in minutes for the selected rows, overall and per group_by label."""
+    start, end = columns['entry'], columns[end_key]
+    valid = (end >= 0) & (end >= start)  # -1 marks a NULL timestamp
+    if rows is not None:
+        valid &= rows
+    minutes = (end[valid] - start[valid]) / 60.0
+
+    overall = summarize_groups(minutes, np.zeros(minutes.size, dtype=np.int32))
+    if overall:
+        overall[0].pop("code")
+    else:
+        overall = [{"count": 0, "mean_minutes": None,
+                    **{f"p{p}_minutes": None for p in ANALYTICS_PERCENTILES}, "max_minutes": None}]
+    result = {"overall": overall[0]}
+    if group_by is None:
+        return result
+
+    labels = columns[group_by + '_labels']
+    groups = [{group_by: labels[group.pop("code")], **group}
+              for group in summarize_groups(minutes, columns[group_by][valid])]
+    result["groups"] = sorted(groups, key=lambda g: g["count"], reverse=True)
+    return result
+
+def get_analytics_report(report_type: str, start_date: Optional[str], end_date: Optional[str],
+                         group_by: Optional[str]) -> ApiResponse:
+    if group_by is not None and group_by not in ANALYTICS_GROUPS:
+        raise HTTPException(status_code=400, detail="Invalid group_by. Use 'host' or 'category'")
+    start_day, end_day = parse_report_range(start_date, end_date)
+
+    db = VMSDatabase()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        columns = load_visit_columns(cursor, start_day, end_day)
+    finally:
+        cursor.close()
+        conn.close()
+
+    data = {"start_date": start_day.isoformat(), "end_date": end_day.isoformat()}
+
+    if report_type == "heatmap":
+        data.update(arrival_heatmap(columns))
+        return ApiResponse(success=True, message="Arrival heatmap generated", data=data)
+
+    elif report_type == "dwell":
+        data.update(duration_stats(columns, 'out', group_by))
+        return ApiResponse(success=True, message="Dwell time report generated", data=data)
+
+    else:
+        # approve_dt is also stamped on rejection; only approved visits count here
+        data.update(duration_stats(columns, 'approve', group_by, columns['status'] == VISIT_APPROVED))
+        return ApiResponse(success=True, message="Approval turnaround report generated (approved visits only)",
+                           data=data)
+
 # API Endpoints
 @app.post("/api/auth/login", response_model=Token)
 async def login(user_login: UserLogin):
@@ -581,7 +823,12 @@ async def get_active_visitors(current_user: dict = Depends(require_permission('C
         conn.close()
 
 @app.get("/api/reports/{report_type}", response_model=ApiResponse)
-async def get_reports(report_type: str, date: Optional[str] = None, current_user: dict = Depends(require_permission('VIEW_REPORTS'))):
+async def get_reports(report_type: str, date: Optional[str] = None, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None, group_by: Optional[str] = None,
+                      current_user: dict = Depends(require_permission('VIEW_REPORTS'))):
+    if report_type in ANALYTICS_REPORTS:
+        return get_analytics_report(report_type, start_date, end_date, group_by)
+
     db = VMSDatabase()
     conn = db.get_connection()
     cursor = conn.cursor(dictionary=True)
@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import main
+
+DAY = datetime(2024, 1, 1).date()  # a Monday
+
+
+class FakeCursor:
+    """Answers the version and column queries from self.rows; records the ranges of each column query."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.queries = []
+
+    def execute(self, query, params):
+        ranges = [(main.day_seconds(first), main.day_seconds(after)) for first, after in zip(params[::2], params[1::2])]
+        rows = sorted(row for row in self.rows if any(lo <= row[0] < hi for lo, hi in ranges))
+        if "GROUP BY DATE(entry_date)" in query:
+            versions = {}
+            for row in rows:
+                day = main.EPOCH_DAY + timedelta(days=row[0] // 86400)
+                count, decided, checked_out, _ = versions.get(day, main.EMPTY_DAY_VERSION)
+                versions[day] = (count + 1, decided + (row[3] != main.VISIT_PENDING), checked_out + (row[2] >= 0), None)
+            self.result = [(day, *version) for day, version in versions.items()]
+        else:
+            self.queries.append(ranges)
+            self.result = rows
+
+    def fetchall(self):
+        return self.result
+
+
+def visit(day, hour=9, dwell_minutes=60, status=main.VISIT_APPROVED, host='EMP001', category='Guest'):
+    entry = main.day_seconds(day) + hour * 3600
+    approve = entry + 300 if status != main.VISIT_PENDING else -1
+    out = entry + dwell_minutes * 60 if status == main.VISIT_APPROVED and dwell_minutes is not None else -1
+    return (entry, approve, out, status, host, category)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(main, 'analytics_day_cache', {})
+
+
+def test_summarize_groups_matches_np_percentile():
+    rng = np.random.default_rng(26)
+    minutes = rng.random(500) * 120
+    codes = rng.integers(0, 6, 500).astype(np.int32)
+    minutes = np.append(minutes, 42.0)
+    codes = np.append(codes, 9).astype(np.int32)  # group of size 1; codes 6-8 absent
+
+    groups = main.summarize_groups(minutes, codes)
+
+    assert [group['code'] for group in groups] == [0, 1, 2, 3, 4, 5, 9]
+    for group in groups:
+        values = minutes[codes == group['code']]
+        assert group['count'] == values.size
+        assert group['mean_minutes'] == pytest.approx(round(values.mean(), 2))
+        assert group['max_minutes'] == pytest.approx(round(values.max(), 2))
+        for p, expected in zip(main.ANALYTICS_PERCENTILES, np.percentile(values, main.ANALYTICS_PERCENTILES)):
+            assert group[f'p{p}_minutes'] == pytest.approx(round(expected, 2))
+    assert groups[-1]['p50_minutes'] == groups[-1]['p95_minutes'] == 42.0
+
+
+def test_summarize_groups_empty_input():
+    assert main.summarize_groups(np.array([]), np.array([], dtype=np.int32)) == []
+
+
+def test_arrival_heatmap_places_weekday_and_hour():
+    rows = [visit(DAY, hour=9), visit(DAY, hour=9), visit(DAY + timedelta(days=6), hour=23)]
+    slices = main.split_visit_columns(sorted(rows), [DAY + timedelta(days=i) for i in range(7)])
+    columns = main.merge_visit_columns(list(slices.values()))
+
+    report = main.arrival_heatmap(columns)
+
+    assert report['total'] == 3
+    assert report['heatmap'][0][9] == 2  # Monday 09:00
+    assert report['heatmap'][6][23] == 1  # Sunday 23:00
+    assert report['peak_hour'] == 9
+    assert report['peak_weekday'] == 'Mon'
+
+
+def test_turnaround_counts_approved_visits_only():
+    rows = [visit(DAY, host='A'), visit(DAY, hour=10, status=main.VISIT_REJECTED, host='B')]
+    columns = main.load_visit_columns(FakeCursor(rows), DAY, DAY)
+
+    report = main.duration_stats(columns, 'approve', 'host', columns['status'] == main.VISIT_APPROVED)
+
+    assert report['overall']['count'] == 1
+    assert [group['host'] for group in report['groups']] == ['A']
+
+
+def test_load_visit_columns_reuses_unchanged_days():
+    days = [DAY, DAY + timedelta(days=1)]
+    cursor = FakeCursor([
+        visit(days[0], status=main.VISIT_PENDING),
+        visit(days[0], hour=10, dwell_minutes=None),  # approved, still inside
+        visit(days[1], host='EMP002'),
+    ])
+
+    columns = main.load_visit_columns(cursor, days[0], days[1])
+    again = main.load_visit_columns(cursor, days[0], days[1])
+
+    assert columns['entry'].size == again['entry'].size == 3
+    assert set(main.analytics_day_cache) == set(days)  # days with open rows are cached too
+    assert len(cursor.queries) == 1
+
+
+def test_load_visit_columns_picks_up_row_inserted_after_caching():
+    # e.g. the database's "today" cached by an app server whose clock is a day ahead,
+    # or a row committed just after midnight
+    cursor = FakeCursor([visit(DAY, hour=9)])
+    assert main.load_visit_columns(cursor, DAY, DAY + timedelta(days=1))['entry'].size == 1
+
+    cursor.rows.append(visit(DAY, hour=23))
+    cursor.rows.append(visit(DAY + timedelta(days=1), hour=0))
+    columns = main.load_visit_columns(cursor, DAY, DAY + timedelta(days=1))
+
+    assert columns['entry'].size == 3
+    assert main.arrival_heatmap(columns)['hourly'][23] == 1
+
+
+def test_load_visit_columns_picks_up_row_updated_after_caching():
+    days = [DAY, DAY + timedelta(days=1)]
+    cursor = FakeCursor([visit(days[0], status=main.VISIT_PENDING), visit(days[1])])
+    assert main.duration_stats(main.load_visit_columns(cursor, days[0], days[1]), 'out')['overall']['count'] == 1
+
+    # Approved and checked out days later
+    cursor.rows[0] = visit(days[0], dwell_minutes=30)
+    columns = main.load_visit_columns(cursor, days[0], days[1])
+
+    assert cursor.queries[-1] == [(main.day_seconds(days[0]), main.day_seconds(days[1]))]
+    assert main.duration_stats(columns, 'out')['overall']['count'] == 2
+
+
+def test_load_visit_columns_fetches_only_missing_runs():
+    days = [DAY + timedelta(days=i) for i in range(5)]
+    cursor = FakeCursor([visit(day) for day in days])
+    main.load_visit_columns(cursor, days[1], days[1])
+    main.load_visit_columns(cursor, days[3], days[3])
+
+    columns = main.load_visit_columns(cursor, days[0], days[4])
+
+    assert columns['entry'].size == 5
+    assert cursor.queries[-1] == [
+        (main.day_seconds(days[0]), main.day_seconds(days[1])),
+        (main.day_seconds(days[2]), main.day_seconds(days[3])),
+        (main.day_seconds(days[4]), main.day_seconds(days[4] + timedelta(days=1))),
+    ]
+
+
+def test_load_visit_columns_evicts_without_dropping_requested_days(monkeypatch):
+    monkeypatch.setattr(main, 'ANALYTICS_CACHE_MAX_DAYS', 5)
+    days = [DAY + timedelta(days=i) for i in range(10)]
+    cursor = FakeCursor([visit(day, host=f'EMP{i}') for i, day in enumerate(days)])
+    main.load_visit_columns(cursor, days[8], days[9])  # cached, outside the next request
+    main.load_visit_columns(cursor, days[0], days[2])  # cache is now full
+
+    # Regression: days[0..2] are older than the missing days and used to be evicted mid-request
+    columns = main.load_visit_columns(cursor, days[0], days[3])
+
+    assert columns['entry'].size == 4
+    assert [columns['host_labels'][code] for code in columns['host']] == ['EMP0', 'EMP1', 'EMP2', 'EMP3']
+    assert set(main.analytics_day_cache) == set(days[:4]) | {days[9]}